@@ -0,0 +1,88 @@
+# Author: Kay Patel
+
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+FINE_PER_DAY = 0.10
+
+
+class FineLedger:
+    """Optional NumPy-backed record of every checked out item, used by the Library to accrue fines for all
+    overdue items in one vectorized pass instead of walking each patron's checked out items."""
+
+    def __init__(self, capacity=1024):
+        """Creates a fine ledger object and initializes its arrays. Raises ImportError if NumPy is not installed."""
+        if np is None:
+            raise ImportError("FineLedger requires NumPy")
+        self._due_dates = np.zeros(capacity, dtype=np.int64)
+        self._fined_through = np.zeros(capacity, dtype=np.int64)
+        self._patron_indexes = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self._item_slots = {}
+        self._patrons = []
+        self._patron_indexes_by_id = {}
+        self._lock = threading.Lock()
+
+    def get_checked_out_count(self):
+        """Returns the number of checked out items tracked by the ledger."""
+        return len(self._item_slots)
+
+    def _grow(self):
+        """Doubles the capacity of the ledger's arrays."""
+        capacity = len(self._due_dates)
+        self._due_dates = np.concatenate((self._due_dates, np.zeros(capacity, dtype=np.int64)))
+        self._fined_through = np.concatenate((self._fined_through, np.zeros(capacity, dtype=np.int64)))
+        self._patron_indexes = np.concatenate((self._patron_indexes, np.zeros(capacity, dtype=np.int64)))
+        self._active = np.concatenate((self._active, np.zeros(capacity, dtype=bool)))
+        self._free_slots.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _patron_index(self, patron):
+        """Returns the ledger's index for the patron, assigning a new one on first use."""
+        index = self._patron_indexes_by_id.get(id(patron))
+        if index is None:
+            index = len(self._patrons)
+            self._patrons.append(patron)
+            self._patron_indexes_by_id[id(patron)] = index
+        return index
+
+    def add_checkout(self, library_item, patron):
+        """Records that the library item was checked out to the patron on the item's checked out date."""
+        with self._lock:
+            if not self._free_slots:
+                self._grow()
+            slot = self._free_slots.pop()
+            self._due_dates[slot] = library_item.get_date_checked_out() + library_item.get_check_out_length()
+            self._fined_through[slot] = library_item.get_date_checked_out()
+            self._patron_indexes[slot] = self._patron_index(patron)
+            self._active[slot] = True
+            self._item_slots[id(library_item)] = slot
+
+    def remove_checkout(self, library_item, date):
+        """Stops tracking the library item once it has been returned on the date.
+        Returns the number of overdue days up to the date that have not been accrued yet."""
+        with self._lock:
+            slot = self._item_slots.pop(id(library_item), None)
+            if slot is None:
+                return 0
+            self._active[slot] = False
+            self._free_slots.append(slot)
+            return max(0, date - max(int(self._due_dates[slot]), int(self._fined_through[slot])))
+
+    def accrue_fines(self, date):
+        """Returns a list of (patron, fine) pairs for the overdue days up to and including the date that have not
+        been accrued yet. An item is overdue on every day later than its due date."""
+        with self._lock:
+            overdue_from = np.maximum(self._due_dates, self._fined_through)
+            overdue_days = np.clip(date - overdue_from, 0, None)
+            overdue_days[~self._active] = 0
+            np.maximum(self._fined_through, date, out=self._fined_through, where=self._active)
+            totals = np.bincount(self._patron_indexes, weights=overdue_days, minlength=len(self._patrons))
+            patrons = self._patrons
+        charged = np.nonzero(totals)[0]
+        return [(patrons[index], float(totals[index]) * FINE_PER_DAY) for index in charged]
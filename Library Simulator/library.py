@@ -1,5 +1,9 @@
 # Author: Kay Patel
 
+import threading
+
+from fine_ledger import FINE_PER_DAY
+
 
 class LibraryItem:
     """Base class that represents all library items."""
@@ -12,6 +16,8 @@ class LibraryItem:
         self._checked_out_by = None
         self._requested_by = None
         self._date_checked_out = 0
+        self._fined_through = 0
+        self._lock = threading.Lock()
 
     def get_library_item_id(self):
         """Returns the unique identifier for the library item."""
@@ -26,19 +32,19 @@ class LibraryItem:
         self._location = location
 
     def get_checked_out_by(self):
-        """Returns the name of the patron who the item is checked out to."""
+        """Returns the patron who the item is checked out to."""
         return self._checked_out_by
 
-    def set_checked_out_by(self, patron_name):
-        """Sets checked out by to the name of the patron who is checking out the library item."""
-        self._checked_out_by = patron_name
+    def set_checked_out_by(self, patron):
+        """Sets checked out by to the patron who is checking out the library item."""
+        self._checked_out_by = patron
 
     def get_requested_by(self):
-        """Returns the name of the patron who requested the library item."""
+        """Returns the patron who requested the library item."""
         return self._requested_by
 
     def set_requested_by(self, value):
-        """Sets the requested by to the name of the patron requesting the library item."""
+        """Sets the requested by to the patron requesting the library item."""
         self._requested_by = value
 
     def get_date_checked_out(self):
@@ -49,6 +55,18 @@ class LibraryItem:
         """Sets the checked out date for the library item."""
         self._date_checked_out = date
 
+    def get_fined_through(self):
+        """Returns the last date for which overdue fines have been charged on the library item."""
+        return self._fined_through
+
+    def set_fined_through(self, date):
+        """Sets the last date for which overdue fines have been charged on the library item."""
+        self._fined_through = date
+
+    def get_lock(self):
+        """Returns the lock guarding the library item's location, checked out by, requested by and checked out date."""
+        return self._lock
+
 
 class Book(LibraryItem):
     """Subclass that represents a book as a library item."""
@@ -110,6 +128,7 @@ class Patron:
         self._name = name
         self._checked_out_items = []
         self._fine_amount = 0
+        self._lock = threading.Lock()
 
     def get_patron_id(self):
         """Returns the unique identifier for the patron."""
@@ -127,6 +146,10 @@ class Patron:
         """Returns the patron's fine amount."""
         return self._fine_amount
 
+    def get_lock(self):
+        """Returns the lock guarding the patron's checked out items and fine amount."""
+        return self._lock
+
     def amend_fine(self, amount):
         """Updates the patron's fine amount."""
         self._fine_amount += amount
@@ -141,62 +164,154 @@ class Patron:
 
 
 class Library:
-    """Base class that represents all libraries."""
-
-    def __init__(self):
-        """Creates a library object and initializes its attributes."""
-        self._holdings = []
-        self._members = []
+    """Base class that represents all libraries.
+
+    The library can be shared between threads. Each LibraryItem and Patron carries its own lock so that
+    operations on unrelated items and patrons run in parallel. When both are needed, the patron's lock is
+    always acquired before the item's lock to avoid deadlock."""
+
+    def __init__(self, fine_ledger=None):
+        """Creates a library object and initializes its attributes.
+        If a FineLedger is given, checkouts are recorded in it and fines are accrued in one vectorized pass.
+        The holdings and membership are dictionaries keyed by ID so that lookups take constant time."""
+        self._holdings = {}
+        self._members = {}
         self._current_date = 0
+        self._date_lock = threading.Lock()
+        self._fine_ledger = fine_ledger
 
     def get_current_date(self):
         """Returns the library's current date."""
         return self._current_date
 
     def add_library_item(self, library_item):
-        """Adds a library item to the library's holdings."""
-        self._holdings.append(library_item)
+        """Adds a library item to the library's holdings. If an item with the same ID is already held, the first one is kept."""
+        self._holdings.setdefault(library_item.get_library_item_id(), library_item)
 
     def add_patron(self, patron):
-        """Adds a patron to the library's membership."""
-        self._members.append(patron)
+        """Adds a patron to the library's membership. If a patron with the same ID is already a member, the first one is kept."""
+        self._members.setdefault(patron.get_patron_id(), patron)
 
     def lookup_library_item_from_id(self, library_item_id):
         """Returns the LibraryItem object corresponding to the ID parameter, or None if no such LibraryItem is in the holdings."""
-        # Available upon request
-        pass
+        return self._holdings.get(library_item_id)
 
     def lookup_patron_from_id(self, patron_id):
         """Returns the Patron object corresponding to the ID parameter, or None if no such Patron is a member."""
-        # Available upon request
-        pass
+        return self._members.get(patron_id)
 
     def check_out_library_item(self, patron_id, library_item_id):
         """Checks out a library item to a library member."""
-        # Available upon request
-        pass
-        
+        patron = self.lookup_patron_from_id(patron_id)
+        if patron is None:
+            return "patron not found"
+        library_item = self.lookup_library_item_from_id(library_item_id)
+        if library_item is None:
+            return "item not found"
+
+        with patron.get_lock(), library_item.get_lock():
+            if library_item.get_location() == "CHECKED_OUT":
+                return "item already checked out"
+            requested_by = library_item.get_requested_by()
+            if requested_by is not None and requested_by is not patron:
+                return "item on hold by other patron"
+            library_item.set_checked_out_by(patron)
+            library_item.set_date_checked_out(self._current_date)
+            library_item.set_fined_through(self._current_date)
+            library_item.set_location("CHECKED_OUT")
+            if requested_by is patron:
+                library_item.set_requested_by(None)
+            patron.add_library_item(library_item)
+            if self._fine_ledger is not None:
+                self._fine_ledger.add_checkout(library_item, patron)
+        return "check out successful"
 
     def return_library_item(self, library_item_id):
         """Allows a member to return a library item."""
-        # Available upon request
-        pass
+        library_item = self.lookup_library_item_from_id(library_item_id)
+        if library_item is None:
+            return "item not found"
+
+        while True:
+            patron = library_item.get_checked_out_by()
+            if patron is None:
+                return "item already in library"
+            # The patron's lock must be taken before the item's, so re-check that the item
+            # was not returned by another thread in between.
+            with patron.get_lock(), library_item.get_lock():
+                if library_item.get_checked_out_by() is not patron:
+                    continue
+                # The date may have advanced without this patron's fines being accrued yet,
+                # so charge any overdue days up to today before the item leaves the patron.
+                if self._fine_ledger is not None:
+                    overdue_days = self._fine_ledger.remove_checkout(library_item, self._current_date)
+                    if overdue_days > 0:
+                        patron.amend_fine(FINE_PER_DAY * overdue_days)
+                else:
+                    self._charge_overdue_days(patron, library_item, self._current_date)
+                patron.remove_library_item(library_item)
+                if library_item.get_requested_by() is not None:
+                    library_item.set_location("ON_HOLD_SHELF")
+                else:
+                    library_item.set_location("ON_SHELF")
+                library_item.set_checked_out_by(None)
+            return "return successful"
 
     def request_library_item(self, patron_id, library_item_id):
         """Allows a member to request a library item."""
-        # Available upon request
-        pass
+        patron = self.lookup_patron_from_id(patron_id)
+        if patron is None:
+            return "patron not found"
+        library_item = self.lookup_library_item_from_id(library_item_id)
+        if library_item is None:
+            return "item not found"
+
+        with library_item.get_lock():
+            if library_item.get_requested_by() is not None:
+                return "item already on hold"
+            library_item.set_requested_by(patron)
+            if library_item.get_location() == "ON_SHELF":
+                library_item.set_location("ON_HOLD_SHELF")
+        return "request successful"
 
     def pay_fine(self, patron_id, amount):
         """Allows members to pay fines on library items."""
-        # Available upon request
-        pass
-
-
-    def increment_current_date(self):
-        """Updates fines based on increments to the current date."""
-        # Available upon request
-        pass
+        patron = self.lookup_patron_from_id(patron_id)
+        if patron is None:
+            return "patron not found"
+
+        with patron.get_lock():
+            patron.amend_fine(-amount)
+        return "payment successful"
+
+    def _charge_overdue_days(self, patron, library_item, date):
+        """Charges the patron FINE_PER_DAY for each overdue day of the library item up to the date that has not been
+        charged yet. Must be called with the patron's lock held."""
+        due_date = library_item.get_date_checked_out() + library_item.get_check_out_length()
+        overdue_days = date - max(due_date, library_item.get_fined_through())
+        if overdue_days > 0:
+            patron.amend_fine(FINE_PER_DAY * overdue_days)
+        if date > library_item.get_fined_through():
+            library_item.set_fined_through(date)
+
+    def increment_current_date(self, days=1):
+        """Updates fines based on increments to the current date. Charges 10 cents for each day an item is overdue.
+        Each item records the date it has been fined through, so an item returned before its patron's fines are
+        accrued is charged by the return instead, and no day is charged twice."""
+        with self._date_lock:
+            self._current_date += days
+            new_date = self._current_date
+
+        if self._fine_ledger is not None:
+            for patron, fine in self._fine_ledger.accrue_fines(new_date):
+                with patron.get_lock():
+                    patron.amend_fine(fine)
+            return
+
+        for patron in list(self._members.values()):
+            with patron.get_lock():
+                for library_item in patron.get_checked_out_items():
+                    self._charge_overdue_days(patron, library_item, new_date)
 
 
 def main():
@@ -0,0 +1,140 @@
+# Author: Kay Patel
+
+import os
+import random
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from library import Book, Album, Movie, Patron, Library
+from fine_ledger import np, FINE_PER_DAY, FineLedger
+
+
+class LibraryStressTest(unittest.TestCase):
+    """Hammers a shared Library from many threads and checks its invariants afterwards."""
+
+    THREADS = 8
+
+    def setUp(self):
+        """Makes thread switches frequent so operations interleave as much as possible."""
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        """Restores the thread switch interval."""
+        sys.setswitchinterval(self._switch_interval)
+
+    def build_library(self, fine_ledger=None, items=60, patrons=20):
+        """Returns a library with a mix of books, albums and movies and some patrons."""
+        library = Library(fine_ledger)
+        item_types = (Book, Album, Movie)
+        for number in range(items):
+            library.add_library_item(item_types[number % 3]("item%d" % number, "Title", "Creator"))
+        for number in range(patrons):
+            library.add_patron(Patron("patron%d" % number, "Patron"))
+        return library, ["item%d" % number for number in range(items)], ["patron%d" % number for number in range(patrons)]
+
+    def run_threads(self, worker):
+        """Runs the worker with seeds 0 to THREADS - 1 on separate threads and waits for them to finish."""
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def check_no_item_checked_out_twice(self, fine_ledger=None):
+        """Mixes checkouts, returns, requests and date increments and checks item and patron state agree."""
+        library, item_ids, patron_ids = self.build_library(fine_ledger)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(3000):
+                roll = rng.random()
+                if roll < 0.45:
+                    library.check_out_library_item(rng.choice(patron_ids), rng.choice(item_ids))
+                elif roll < 0.85:
+                    library.return_library_item(rng.choice(item_ids))
+                elif roll < 0.97:
+                    library.request_library_item(rng.choice(patron_ids), rng.choice(item_ids))
+                else:
+                    library.increment_current_date()
+
+        self.run_threads(worker)
+
+        holders = {}
+        for patron_id in patron_ids:
+            patron = library.lookup_patron_from_id(patron_id)
+            for library_item in patron.get_checked_out_items():
+                self.assertNotIn(library_item.get_library_item_id(), holders)
+                holders[library_item.get_library_item_id()] = patron
+        for item_id in item_ids:
+            library_item = library.lookup_library_item_from_id(item_id)
+            self.assertIs(library_item.get_checked_out_by(), holders.get(item_id))
+            self.assertEqual(library_item.get_location() == "CHECKED_OUT", item_id in holders)
+            if library_item.get_location() == "ON_HOLD_SHELF":
+                self.assertIsNotNone(library_item.get_requested_by())
+
+    def check_fines_consistent(self, fine_ledger=None):
+        """Returns items and pays fines while the date advances, then checks every patron's fine against the
+        overdue days of their items. A return's overdue days are bounded by the dates seen before and after it."""
+        library, item_ids, patron_ids = self.build_library(fine_ledger, items=400)
+        due_dates = {}
+        for number, item_id in enumerate(item_ids):
+            patron_id = patron_ids[number % len(patron_ids)]
+            self.assertEqual(library.check_out_library_item(patron_id, item_id), "check out successful")
+            library_item = library.lookup_library_item_from_id(item_id)
+            due_dates[item_id] = (patron_id, library_item.get_check_out_length())
+
+        low = {patron_id: 0.0 for patron_id in patron_ids}
+        high = {patron_id: 0.0 for patron_id in patron_ids}
+        totals_lock = threading.Lock()
+        done = threading.Event()
+
+        def advance_dates():
+            for _ in range(100):
+                library.increment_current_date()
+            done.set()
+
+        def return_items(seed):
+            rng = random.Random(seed)
+            for item_id in item_ids[seed::self.THREADS]:
+                patron_id, due_date = due_dates[item_id]
+                while not done.is_set() and rng.random() < 0.99:
+                    pass
+                before = library.get_current_date()
+                library.return_library_item(item_id)
+                after = library.get_current_date()
+                library.pay_fine(patron_id, 0.25)
+                with totals_lock:
+                    low[patron_id] += FINE_PER_DAY * max(0, before - due_date) - 0.25
+                    high[patron_id] += FINE_PER_DAY * max(0, after - due_date) - 0.25
+
+        date_thread = threading.Thread(target=advance_dates)
+        date_thread.start()
+        self.run_threads(return_items)
+        date_thread.join()
+
+        for patron_id in patron_ids:
+            fine = library.lookup_patron_from_id(patron_id).get_fine_amount()
+            self.assertGreaterEqual(fine, low[patron_id] - 1e-9)
+            self.assertLessEqual(fine, high[patron_id] + 1e-9)
+
+    def test_no_item_checked_out_twice(self):
+        self.check_no_item_checked_out_twice()
+
+    def test_fines_consistent(self):
+        self.check_fines_consistent()
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_no_item_checked_out_twice_with_fine_ledger(self):
+        self.check_no_item_checked_out_twice(FineLedger(16))
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_fines_consistent_with_fine_ledger(self):
+        self.check_fines_consistent(FineLedger(16))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+# Author: Kay Patel
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from library import Book, Album, Movie, Patron, Library
+from fine_ledger import FineLedger
+
+
+OPERATIONS = ("check_out", "request", "return", "pay_fine", "increment_date")
+
+
+class SimulationConfig:
+    """Holds the settings for a library simulation run."""
+
+    def __init__(self, items=1000, patrons=100, operations=10000, seed=0, day_every=100,
+                 weights=(40, 10, 35, 5), trace_memory=True, fine_ledger=False):
+        """Creates a simulation config object and initializes its attributes.
+        Weights are the relative frequencies of check out, request, return and pay fine operations;
+        the date is advanced once every day_every operations. Tracing memory slows every allocation,
+        so turn it off when only latencies matter. If fine_ledger is set, fines are accrued with a FineLedger."""
+        self._items = items
+        self._patrons = patrons
+        self._operations = operations
+        self._seed = seed
+        self._day_every = day_every
+        self._weights = weights
+        self._trace_memory = trace_memory
+        self._fine_ledger = fine_ledger
+
+    def get_items(self):
+        """Returns the number of library items in the synthetic catalog."""
+        return self._items
+
+    def get_patrons(self):
+        """Returns the number of patrons in the synthetic membership."""
+        return self._patrons
+
+    def get_operations(self):
+        """Returns the number of workload operations to run."""
+        return self._operations
+
+    def get_seed(self):
+        """Returns the random seed used for the catalog and workload."""
+        return self._seed
+
+    def get_day_every(self):
+        """Returns how many operations run between each date increment."""
+        return self._day_every
+
+    def get_weights(self):
+        """Returns the relative weights of check out, request, return and pay fine operations."""
+        return self._weights
+
+    def get_trace_memory(self):
+        """Returns whether peak memory is traced during the run."""
+        return self._trace_memory
+
+    def get_fine_ledger(self):
+        """Returns whether the library accrues fines with a NumPy-backed FineLedger."""
+        return self._fine_ledger
+
+
+class SimulationReport:
+    """Collects per-operation latencies and summary figures for a simulation run."""
+
+    def __init__(self):
+        """Creates a simulation report object and initializes its attributes."""
+        self._latencies = {operation: [] for operation in OPERATIONS}
+        self._elapsed = 0.0
+        self._peak_memory = 0
+
+    def record(self, operation, seconds):
+        """Records the latency of a single operation."""
+        self._latencies[operation].append(seconds)
+
+    def get_latencies(self, operation):
+        """Returns the list of recorded latencies for the operation."""
+        return self._latencies[operation]
+
+    def get_elapsed(self):
+        """Returns the total wall clock time of the workload in seconds."""
+        return self._elapsed
+
+    def set_elapsed(self, seconds):
+        """Sets the total wall clock time of the workload."""
+        self._elapsed = seconds
+
+    def get_peak_memory(self):
+        """Returns the peak traced memory in bytes."""
+        return self._peak_memory
+
+    def set_peak_memory(self, peak):
+        """Sets the peak traced memory."""
+        self._peak_memory = peak
+
+    def get_total_operations(self):
+        """Returns the number of operations recorded."""
+        return sum(len(latencies) for latencies in self._latencies.values())
+
+    def get_throughput(self):
+        """Returns the number of operations per second."""
+        if self._elapsed == 0:
+            return 0.0
+        return self.get_total_operations() / self._elapsed
+
+    def format(self):
+        """Returns the report as printable text."""
+        lines = ["operations: %d" % self.get_total_operations(),
+                 "elapsed: %.3f s" % self._elapsed,
+                 "throughput: %.0f ops/s" % self.get_throughput(),
+                 "peak memory: %.1f MiB" % (self._peak_memory / (1024 * 1024)),
+                 "%-15s %10s %12s %12s" % ("operation", "count", "p50 (us)", "p99 (us)")]
+        for operation in OPERATIONS:
+            latencies = self._latencies[operation]
+            lines.append("%-15s %10d %12.1f %12.1f" % (operation, len(latencies),
+                                                     percentile(latencies, 50) * 1e6,
+                                                     percentile(latencies, 99) * 1e6))
+        return "\n".join(lines)
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile of the values using the nearest-rank method, or 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def build_library(config, rng):
+    """Returns a library stocked with a synthetic catalog and membership, plus the item IDs and a dictionary
+    of patron ID to Patron."""
+    library = Library(FineLedger() if config.get_fine_ledger() else None)
+    item_types = (Book, Album, Movie)
+    item_ids = []
+    for number in range(config.get_items()):
+        item_id = "item%d" % number
+        item_type = rng.choice(item_types)
+        library.add_library_item(item_type(item_id, "Title %d" % number, "Creator %d" % number))
+        item_ids.append(item_id)
+    patrons = {}
+    for number in range(config.get_patrons()):
+        patron_id = "patron%d" % number
+        patrons[patron_id] = Patron(patron_id, "Patron %d" % number)
+        library.add_patron(patrons[patron_id])
+    return library, item_ids, patrons
+
+
+def run_simulation(config):
+    """Builds a synthetic library, drives a seeded random workload against it and returns a SimulationReport."""
+    rng = random.Random(config.get_seed())
+    report = SimulationReport()
+
+    if config.get_trace_memory():
+        tracemalloc.start()
+    library, item_ids, patrons = build_library(config, rng)
+    patron_ids = list(patrons)
+
+    actions = OPERATIONS[:4]
+    weights = config.get_weights()
+    clock = time.perf_counter
+    started = clock()
+    for step in range(1, config.get_operations() + 1):
+        if step % config.get_day_every() == 0:
+            before = clock()
+            library.increment_current_date()
+            report.record("increment_date", clock() - before)
+            continue
+
+        action = rng.choices(actions, weights)[0]
+        if action == "check_out":
+            patron_id, item_id = rng.choice(patron_ids), rng.choice(item_ids)
+            before = clock()
+            library.check_out_library_item(patron_id, item_id)
+        elif action == "request":
+            patron_id, item_id = rng.choice(patron_ids), rng.choice(item_ids)
+            before = clock()
+            library.request_library_item(patron_id, item_id)
+        elif action == "return":
+            item_id = rng.choice(item_ids)
+            before = clock()
+            library.return_library_item(item_id)
+        else:
+            # Patrons pay off part or all of what they owe, so balances stay realistic.
+            patron_id = rng.choice(patron_ids)
+            amount = round(max(0, patrons[patron_id].get_fine_amount()) * rng.uniform(0.25, 1), 2)
+            before = clock()
+            library.pay_fine(patron_id, amount)
+        report.record(action, clock() - before)
+    report.set_elapsed(clock() - started)
+
+    if config.get_trace_memory():
+        report.set_peak_memory(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return report
+
+
+def main():
+    """Runs the library simulation from the command line and prints the report."""
+    parser = argparse.ArgumentParser(description="Library simulation driver and throughput benchmark.")
+    parser.add_argument("--items", type=int, default=1000, help="number of library items")
+    parser.add_argument("--patrons", type=int, default=100, help="number of patrons")
+    parser.add_argument("--operations", type=int, default=10000, help="number of workload operations")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--day-every", type=int, default=100, help="operations between date increments")
+    parser.add_argument("--no-trace-memory", action="store_true", help="skip peak memory tracing")
+    parser.add_argument("--fine-ledger", action="store_true", help="accrue fines with the NumPy fine ledger")
+    args = parser.parse_args()
+
+    config = SimulationConfig(args.items, args.patrons, args.operations, args.seed, args.day_every,
+                              trace_memory=not args.no_trace_memory, fine_ledger=args.fine_ledger)
+    print(run_simulation(config).format())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+# Author: Kay Patel
+
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from store import Product, Store, TrigramIndex, search_keys
+
+
+# File layout: header, one fixed-width record per product, one ID kind byte per product (0 for str, 1 for int),
+# the IDs as NUL-separated UTF-8 text, a string table holding every title and description, then the search
+# index: its keys as NUL-separated UTF-8 text, the start of each key's postings, and the postings themselves
+# as record numbers. Arrays are little-endian.
+MAGIC = b"INVSNAP2"
+HEADER = struct.Struct("<8sQQQQQQQQQQ")
+RECORD = struct.Struct("<qqQIQI")
+DELTA = struct.Struct("<Qq")
+ID_STR = 0
+ID_INT = 1
+
+
+def _to_little_endian(values):
+    """Returns the bytes of an array in little-endian order."""
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    """Returns an array of the typecode read from little-endian bytes."""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def delta_path(path):
+    """Returns the path of the incremental quantity file that belongs to the snapshot at path."""
+    return path + ".delta"
+
+
+def write_snapshot(store, path):
+    """Writes the Store's inventory and its search index to path as a full snapshot and removes any incremental
+    quantity file. Prices are stored as integer cents, so prices with fractions of a cent are rounded.
+    Raises a TypeError if a product ID is not an int or a str."""
+    records = bytearray()
+    kinds = bytearray()
+    ids = []
+    strings = bytearray()
+    postings = {}
+    for position, (ID, product) in enumerate(store.get_inventory().items()):
+        if type(ID) is int:
+            kinds.append(ID_INT)
+        elif type(ID) is str:
+            kinds.append(ID_STR)
+        else:
+            raise TypeError("product ID " + repr(ID) + " is a " + type(ID).__name__ + ", only int and str IDs "
+                            "can be stored in a snapshot")
+        ID = str(ID)
+        if "\0" in ID:
+            raise ValueError("product ID " + repr(ID) + " contains a NUL character")
+        ids.append(ID)
+        for key in search_keys(product.get_title().lower()) | search_keys(product.get_description().lower()):
+            if "\0" in key:
+                raise ValueError("product " + repr(ID) + " has a NUL character in its title or description")
+            postings.setdefault(key, []).append(position)
+        title = product.get_title().encode("utf-8")
+        description = product.get_description().encode("utf-8")
+        title_offset = len(strings)
+        strings += title
+        description_offset = len(strings)
+        strings += description
+        records += RECORD.pack(round(product.get_price() * 100), product.get_quantity_available(),
+                               title_offset, len(title), description_offset, len(description))
+    id_text = "\0".join(ids).encode("utf-8")
+    keys = list(postings)
+    key_text = "\0".join(keys).encode("utf-8")
+    key_starts = array("Q", [0])
+    positions = array("I")
+    for key in keys:
+        positions.extend(postings[key])
+        key_starts.append(len(positions))
+
+    kinds_offset = HEADER.size + len(records)
+    ids_offset = kinds_offset + len(kinds)
+    strings_offset = ids_offset + len(id_text)
+    keys_offset = strings_offset + len(strings)
+    key_starts_offset = keys_offset + len(key_text)
+    positions_offset = key_starts_offset + len(key_starts) * key_starts.itemsize
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, len(kinds), kinds_offset, ids_offset, len(id_text), strings_offset,
+                                        len(keys), keys_offset, len(key_text), key_starts_offset, positions_offset))
+        snapshot_file.write(records)
+        snapshot_file.write(kinds)
+        snapshot_file.write(id_text)
+        snapshot_file.write(strings)
+        snapshot_file.write(key_text)
+        snapshot_file.write(_to_little_endian(key_starts))
+        snapshot_file.write(_to_little_endian(positions))
+    os.replace(temporary_path, path)
+    if os.path.exists(delta_path(path)):
+        os.remove(delta_path(path))
+
+
+class InventorySnapshot:
+    """A memory-mapped inventory snapshot, plus any incremental quantity changes written after it."""
+
+    def __init__(self, path):
+        """Creates an InventorySnapshot object by mapping the file at path and reading its IDs."""
+        self._path = path
+        with open(path, "rb") as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, count, kinds_offset, ids_offset, ids_length, strings_offset,
+         key_count, keys_offset, keys_length, key_starts_offset, positions_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(path + " is not an inventory snapshot")
+        self._count = count
+        self._strings_offset = strings_offset
+        self._positions_offset = positions_offset
+
+        keys = self._map[keys_offset:keys_offset + keys_length].decode("utf-8").split("\0") if key_count else []
+        self._keys = keys
+        self._key_numbers = dict(zip(keys, range(key_count)))
+        self._key_starts = _from_little_endian("Q", self._map[key_starts_offset:positions_offset])
+
+        ids = self._map[ids_offset:ids_offset + ids_length].decode("utf-8").split("\0") if count else []
+        kinds = self._map[kinds_offset:kinds_offset + count]
+        if ID_INT in kinds:
+            ids = [int(ID) if kind == ID_INT else ID for ID, kind in zip(ids, kinds)]
+        self._ids = ids
+        self._positions = dict(zip(ids, range(count)))
+
+        self._quantities = {}
+        if os.path.exists(delta_path(path)):
+            with open(delta_path(path), "rb") as delta_file:
+                data = delta_file.read()
+            # A crash part way through an append leaves an incomplete record at the end. Only the complete records
+            # are replayed, and the rest is cut off so that later appends start on a record boundary.
+            complete = len(data) - len(data) % DELTA.size
+            if complete != len(data):
+                os.truncate(delta_path(path), complete)
+            for position, quantity in DELTA.iter_unpack(data[:complete]):
+                if position < count:
+                    self._quantities[position] = quantity
+
+    def get_path(self):
+        """Returns the path of the snapshot file."""
+        return self._path
+
+    def get_ids(self):
+        """Returns the list of product IDs in the snapshot, in snapshot order."""
+        return self._ids
+
+    def get_position(self, ID):
+        """Returns the record number of the product ID, or None if it isn't in the snapshot."""
+        return self._positions.get(ID)
+
+    def get_quantity(self, position):
+        """Returns the quantity recorded for the product at the record number, including incremental changes."""
+        quantity = self._quantities.get(position)
+        if quantity is None:
+            quantity = RECORD.unpack_from(self._map, HEADER.size + position * RECORD.size)[1]
+        return quantity
+
+    def set_quantity(self, position, quantity):
+        """Records that the product at the record number was saved with the given quantity."""
+        self._quantities[position] = quantity
+
+    def _read_string(self, offset, length):
+        """Returns the string stored at the offset in the string table."""
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def read_texts(self, position):
+        """Returns the title and description stored for the record number, as a tuple."""
+        price_cents, quantity, title_offset, title_length, description_offset, description_length = \
+            RECORD.unpack_from(self._map, HEADER.size + position * RECORD.size)
+        return self._read_string(title_offset, title_length), self._read_string(description_offset, description_length)
+
+    def _read_posting(self, key_number):
+        """Returns the array of record numbers indexed under the key number."""
+        start = self._positions_offset + self._key_starts[key_number] * 4
+        end = self._positions_offset + self._key_starts[key_number + 1] * 4
+        return _from_little_endian("I", self._map[start:end])
+
+    def search_candidates(self, string):
+        """Takes a non-empty lowercase search string and returns the set of product IDs the stored search index
+        lists for it, following the same rules as TrigramIndex.candidates."""
+        if len(string) < 3:
+            positions = set()
+            for key_number, key in enumerate(self._keys):
+                if string in key:
+                    positions.update(self._read_posting(key_number))
+        else:
+            postings = []
+            for trigram in search_keys(string):
+                key_number = self._key_numbers.get(trigram)
+                if key_number is None:
+                    return set()
+                postings.append(self._read_posting(key_number))
+            postings.sort(key=len)
+            positions = set(postings[0])
+            for posting in postings[1:]:
+                positions.intersection_update(posting)
+        ids = self._ids
+        return {ids[position] for position in positions}
+
+    def read_product(self, position):
+        """Returns a new Product built from the record number."""
+        price_cents, quantity, title_offset, title_length, description_offset, description_length = \
+            RECORD.unpack_from(self._map, HEADER.size + position * RECORD.size)
+        return Product(self._ids[position], self._read_string(title_offset, title_length),
+                       self._read_string(description_offset, description_length), price_cents / 100,
+                       self.get_quantity(position))
+
+    def close(self):
+        """Unmaps the snapshot file."""
+        self._map.close()
+
+
+class LazyInventory:
+    """Inventory mapping of product ID to Product backed by an InventorySnapshot.
+    Products are created from the snapshot the first time they are accessed; products added later are kept in memory."""
+
+    def __init__(self, snapshot):
+        """Creates a LazyInventory object and initializes it's attributes."""
+        self._snapshot = snapshot
+        self._products = {}
+        self._added = {}
+        self._lock = threading.Lock()
+
+    def get_snapshot(self):
+        """Returns the snapshot backing the inventory."""
+        return self._snapshot
+
+    def get_loaded_products(self):
+        """Returns a dictionary of record number to Product for the snapshot products created so far."""
+        return self._products
+
+    def get(self, ID, default=None):
+        """Returns the Product with the ID, creating it from the snapshot if needed, or default if there is none."""
+        position = self._snapshot.get_position(ID)
+        if position is None:
+            return self._added.get(ID, default)
+        product = self._products.get(position)
+        if product is None:
+            with self._lock:
+                product = self._products.get(position)
+                if product is None:
+                    product = self._snapshot.read_product(position)
+                    self._products[position] = product
+        return product
+
+    def get_search_texts(self, ID):
+        """Returns the title and description of the product with the ID, as a tuple, without creating the Product
+        if it hasn't been created yet."""
+        position = self._snapshot.get_position(ID)
+        if position is None:
+            product = self._added[ID]
+        else:
+            product = self._products.get(position)
+            if product is None:
+                return self._snapshot.read_texts(position)
+        return product.get_title(), product.get_description()
+
+    def __getitem__(self, ID):
+        """Returns the Product with the ID, or raises KeyError if there is none."""
+        product = self.get(ID)
+        if product is None:
+            raise KeyError(ID)
+        return product
+
+    def __setitem__(self, ID, product):
+        """Adds a Product that is not in the snapshot."""
+        if self._snapshot.get_position(ID) is not None:
+            raise KeyError("product ID " + str(ID) + " is already in the snapshot")
+        self._added[ID] = product
+
+    def __contains__(self, ID):
+        """Returns whether the ID is in the inventory."""
+        return self._snapshot.get_position(ID) is not None or ID in self._added
+
+    def __len__(self):
+        """Returns the number of products in the inventory."""
+        return len(self._snapshot.get_ids()) + len(self._added)
+
+    def __iter__(self):
+        """Iterates over the product IDs."""
+        return iter(self.keys())
+
+    def keys(self):
+        """Returns a list of the product IDs."""
+        return self._snapshot.get_ids() + list(self._added)
+
+    def items(self):
+        """Yields (ID, Product) pairs, creating every snapshot product that hasn't been created yet."""
+        for ID in self._snapshot.get_ids():
+            yield ID, self.get(ID)
+        yield from list(self._added.items())
+
+
+class SnapshotSearchIndex:
+    """Search index that reads postings for snapshot products from the snapshot file and keeps the postings of
+    products added or changed since loading in memory."""
+
+    def __init__(self, snapshot):
+        """Creates a SnapshotSearchIndex object and initializes it's attributes."""
+        self._snapshot = snapshot
+        self._overlay = TrigramIndex()
+        self._replaced = set()
+
+    def add(self, ID, *texts):
+        """Takes an ID and the texts to index for it."""
+        self._overlay.add(ID, *texts)
+
+    def remove(self, ID, *texts):
+        """Takes an ID and the texts it was indexed with and removes it from the index."""
+        if self._snapshot.get_position(ID) is not None:
+            self._replaced.add(ID)
+        self._overlay.remove(ID, *texts)
+
+    def candidates(self, string):
+        """Takes a non-empty lowercase search string and returns a set of IDs that includes every ID whose indexed
+        text contains the string, following the same rules as TrigramIndex.candidates."""
+        found = self._snapshot.search_candidates(string)
+        if self._replaced:
+            found -= self._replaced
+        found |= self._overlay.candidates(string)
+        return found
+
+
+def load_store(path, search_cache_size=512):
+    """Returns a Store whose inventory is lazily loaded from the snapshot at path, searched through the
+    snapshot's stored index. Members are not part of the snapshot and have to be added again."""
+    snapshot = InventorySnapshot(path)
+    return Store(search_cache_size, LazyInventory(snapshot), SnapshotSearchIndex(snapshot))
+
+
+def write_quantity_delta(store):
+    """Appends the quantities of snapshot products that changed since they were last saved to the snapshot's
+    incremental quantity file. Products added after loading need a full write_snapshot.
+    Returns the number of quantities written."""
+    inventory = store.get_inventory()
+    snapshot = inventory.get_snapshot()
+    changes = bytearray()
+    for position, product in list(inventory.get_loaded_products().items()):
+        quantity = product.get_quantity_available()
+        if quantity != snapshot.get_quantity(position):
+            changes += DELTA.pack(position, quantity)
+            snapshot.set_quantity(position, quantity)
+    if changes:
+        with open(delta_path(snapshot.get_path()), "ab") as delta_file:
+            delta_file.write(changes)
+            delta_file.flush()
+            os.fsync(delta_file.fileno())
+    return len(changes) // DELTA.size
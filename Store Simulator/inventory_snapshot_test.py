@@ -0,0 +1,167 @@
+# Author: Kay Patel
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from store import Product, Customer, Store
+from inventory_snapshot import DELTA, delta_path, write_snapshot, load_store, write_quantity_delta
+
+WORDS = ("wood", "steel", "garden", "kitchen", "chair", "table", "lamp", "cable", "phone", "shirt")
+
+
+class InventorySnapshotTest(unittest.TestCase):
+    """Writes snapshots and incremental quantity files, loads them back and compares the result with an
+    in-memory Store holding the same products."""
+
+    PRODUCTS = 300
+
+    def setUp(self):
+        """Creates a temporary directory for the snapshot files."""
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._directory.name, "inventory.snap")
+        self._stores = []
+
+    def tearDown(self):
+        """Unmaps every loaded snapshot and removes the temporary directory."""
+        for store in self._stores:
+            store.get_inventory().get_snapshot().close()
+        self._directory.cleanup()
+
+    def load(self):
+        """Returns a Store loaded from the test's snapshot file."""
+        store = load_store(self._path)
+        self._stores.append(store)
+        return store
+
+    def build_products(self, rng, first_ID, count):
+        """Returns a list of products with random titles and descriptions, priced in whole cents."""
+        products = []
+        for ID in range(first_ID, first_ID + count):
+            title = " ".join(rng.sample(WORDS, 2)) + " " + str(ID)
+            description = " ".join(rng.sample(WORDS, 3))
+            products.append(Product(ID, title, description, rng.randint(1, 50000) / 100, rng.randint(0, 20)))
+        return products
+
+    def build_stores(self, seed=0):
+        """Writes a snapshot of a random catalog and returns an in-memory Store with the same products
+        together with a Store loaded from the snapshot."""
+        rng = random.Random(seed)
+        memory_store = Store()
+        snapshot_store = Store()
+        for product in self.build_products(rng, 0, self.PRODUCTS):
+            memory_store.add_product(product)
+            snapshot_store.add_product(Product(product.get_product_id(), product.get_title(),
+                                               product.get_description(), product.get_price(),
+                                               product.get_quantity_available()))
+        write_snapshot(snapshot_store, self._path)
+        return memory_store, self.load()
+
+    def assert_same_inventory(self, expected, actual):
+        """Checks that both stores hold products with the same IDs, texts, prices and quantities."""
+        self.assertEqual(sorted(expected.get_inventory().keys()), sorted(actual.get_inventory().keys()))
+        for ID in expected.get_inventory().keys():
+            expected_product = expected.lookup_product_from_id(ID)
+            actual_product = actual.lookup_product_from_id(ID)
+            self.assertEqual(actual_product.get_title(), expected_product.get_title())
+            self.assertEqual(actual_product.get_description(), expected_product.get_description())
+            self.assertEqual(actual_product.get_price(), expected_product.get_price())
+            self.assertEqual(actual_product.get_quantity_available(), expected_product.get_quantity_available())
+
+    def assert_same_searches(self, expected, actual, rng):
+        """Checks that product_search gives the same results on both stores for the empty string, substrings
+        of every length from one to six characters and strings that match nothing."""
+        queries = ["", "zzz", "qq", "x"]
+        for _ in range(300):
+            word = rng.choice(WORDS + tuple(str(number) for number in range(20)))
+            length = rng.randint(1, min(6, len(word)))
+            start = rng.randint(0, len(word) - length)
+            queries.append(word[start:start + length].upper() if rng.random() < 0.1 else word[start:start + length])
+        for query in queries:
+            self.assertEqual(actual.product_search(query), expected.product_search(query), query)
+
+    def test_round_trip(self):
+        memory_store, snapshot_store = self.build_stores()
+        self.assert_same_inventory(memory_store, snapshot_store)
+
+    def test_round_trip_keeps_str_and_int_ids(self):
+        store = Store()
+        store.add_product(Product("7", "Text ID", "Description", 1.25, 3))
+        store.add_product(Product(7, "Int ID", "Description", 2.5, 4))
+        write_snapshot(store, self._path)
+        snapshot_store = self.load()
+        self.assertEqual(snapshot_store.lookup_product_from_id("7").get_title(), "Text ID")
+        self.assertEqual(snapshot_store.lookup_product_from_id(7).get_title(), "Int ID")
+        self.assertEqual(snapshot_store.lookup_product_from_id(7).get_price(), 2.5)
+
+    def test_rejects_ids_that_are_not_int_or_str(self):
+        for ID in (True, 1.5, (1,)):
+            store = Store()
+            store.add_product(Product(ID, "Title", "Description", 1, 1))
+            with self.assertRaises(TypeError):
+                write_snapshot(store, self._path)
+            self.assertFalse(os.path.exists(self._path))
+
+    def test_search_matches_in_memory_store(self):
+        rng = random.Random(1)
+        memory_store, snapshot_store = self.build_stores()
+        self.assert_same_searches(memory_store, snapshot_store, rng)
+
+        for ID in rng.sample(range(self.PRODUCTS), 40):
+            title = " ".join(rng.sample(WORDS, 2)) + " renamed " + str(ID)
+            description = rng.choice((None, " ".join(rng.sample(WORDS, 2))))
+            self.assertTrue(memory_store.update_product_text(ID, title, description))
+            self.assertTrue(snapshot_store.update_product_text(ID, title, description))
+        for product in self.build_products(rng, self.PRODUCTS, 30):
+            memory_store.add_product(product)
+            snapshot_store.add_product(Product(product.get_product_id(), product.get_title(),
+                                               product.get_description(), product.get_price(),
+                                               product.get_quantity_available()))
+        self.assertTrue(snapshot_store.update_product_text(self.PRODUCTS, "lamp added then renamed"))
+        self.assertTrue(memory_store.update_product_text(self.PRODUCTS, "lamp added then renamed"))
+
+        self.assert_same_searches(memory_store, snapshot_store, rng)
+        self.assertEqual(snapshot_store.product_search("renamed"), memory_store.product_search("renamed"))
+        self.assert_same_inventory(memory_store, snapshot_store)
+
+    def test_delta_replay(self):
+        rng = random.Random(2)
+        memory_store, snapshot_store = self.build_stores()
+        for store in (memory_store, snapshot_store):
+            store.add_member(Customer("Customer", 1, True))
+        for _ in range(3):
+            for _ in range(50):
+                product_ID = rng.randrange(self.PRODUCTS)
+                quantity = rng.randint(1, 5)
+                memory_store.add_product_to_member_cart(product_ID, 1, quantity)
+                snapshot_store.add_product_to_member_cart(product_ID, 1, quantity)
+            self.assertEqual(snapshot_store.check_out_member(1), memory_store.check_out_member(1))
+            self.assertGreater(write_quantity_delta(snapshot_store), 0)
+            self.assertEqual(write_quantity_delta(snapshot_store), 0)
+            self.assert_same_inventory(memory_store, self.load())
+
+    def test_torn_delta(self):
+        memory_store, snapshot_store = self.build_stores()
+        for store in (memory_store, snapshot_store):
+            store.lookup_product_from_id(5).reserve(1)
+        self.assertEqual(write_quantity_delta(snapshot_store), 1)
+        # A crash part way through the next append leaves part of a record at the end of the file.
+        with open(delta_path(self._path), "ab") as delta_file:
+            delta_file.write(DELTA.pack(6, 1)[:DELTA.size // 2])
+
+        reloaded = self.load()
+        self.assert_same_inventory(memory_store, reloaded)
+        self.assertEqual(os.path.getsize(delta_path(self._path)), DELTA.size)
+
+        for store in (memory_store, reloaded):
+            store.lookup_product_from_id(6).reserve(1)
+        self.assertEqual(write_quantity_delta(reloaded), 1)
+        self.assert_same_inventory(memory_store, self.load())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,268 @@
+# Author: Kay Patel
+
+import argparse
+import asyncio
+import random
+import time
+
+from store import InvalidCheckoutError, Product, Customer, Store
+from store_benchmark import percentile
+
+
+class CartRequest:
+    """A request to add a quantity of a product to a member's cart."""
+
+    def __init__(self, product_ID, customer_ID, quantity, future):
+        """Creates a CartRequest object and initializes it's attributes."""
+        self._product_ID = product_ID
+        self._customer_ID = customer_ID
+        self._quantity = quantity
+        self._future = future
+
+    def get_product_id(self):
+        """Returns the product ID."""
+        return self._product_ID
+
+    def get_customer_id(self):
+        """Returns the customer ID."""
+        return self._customer_ID
+
+    def get_quantity(self):
+        """Returns the quantity to add."""
+        return self._quantity
+
+    def get_future(self):
+        """Returns the future that receives the request's result."""
+        return self._future
+
+
+class CheckoutRequest:
+    """A request to check out a member's cart."""
+
+    def __init__(self, customer_ID, future):
+        """Creates a CheckoutRequest object and initializes it's attributes."""
+        self._customer_ID = customer_ID
+        self._future = future
+
+    def get_customer_id(self):
+        """Returns the customer ID."""
+        return self._customer_ID
+
+    def get_future(self):
+        """Returns the future that receives the request's result."""
+        return self._future
+
+
+class OrderPipeline:
+    """Asynchronous front door for a Store. Requests pass through three stages connected by bounded queues:
+    validation, applying to the store (consecutive checkouts are batched through Store.check_out_members so
+    demand is grouped per product), and delivering the results. When a queue is full, submitting waits,
+    which pushes back on callers during bursts."""
+
+    def __init__(self, store, queue_size=1000, batch_size=100):
+        """Creates an OrderPipeline object and initializes it's attributes."""
+        self._store = store
+        self._batch_size = batch_size
+        self._incoming = asyncio.Queue(queue_size)
+        self._validated = asyncio.Queue(queue_size)
+        self._completed = asyncio.Queue(queue_size)
+        self._tasks = []
+
+    def start(self):
+        """Starts the pipeline's stage tasks on the running event loop."""
+        self._tasks = [asyncio.create_task(self._validate()),
+                       asyncio.create_task(self._apply()),
+                       asyncio.create_task(self._deliver())]
+
+    async def stop(self):
+        """Waits for every submitted request to finish, then stops the stage tasks."""
+        await self._incoming.join()
+        await self._validated.join()
+        await self._completed.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def add_product_to_member_cart(self, product_ID, customer_ID, quantity=1):
+        """Submits a cart request and returns the same messages as Store.add_product_to_member_cart."""
+        future = asyncio.get_running_loop().create_future()
+        await self._incoming.put(CartRequest(product_ID, customer_ID, quantity, future))
+        return await future
+
+    async def check_out_member(self, customer_ID):
+        """Submits a checkout request and returns the member's charge.
+        Raises an InvalidCheckoutError if the ID doesn't match a member of the store."""
+        future = asyncio.get_running_loop().create_future()
+        await self._incoming.put(CheckoutRequest(customer_ID, future))
+        return await future
+
+    async def _validate(self):
+        """Rejects requests for unknown members or products and passes the rest on.
+        A request that raises is completed with its exception so the stage keeps running."""
+        store = self._store
+        while True:
+            request = await self._incoming.get()
+            try:
+                customer_ID = request.get_customer_id()
+                if isinstance(request, CartRequest):
+                    if request.get_quantity() < 1:
+                        result = ValueError("quantity must be at least 1, got " + str(request.get_quantity()))
+                    elif store.lookup_product_from_id(request.get_product_id()) is None:
+                        result = "product ID not found"
+                    elif store.lookup_member_from_id(customer_ID) is None:
+                        result = "member ID not found"
+                    else:
+                        result = None
+                elif store.lookup_member_from_id(customer_ID) is None:
+                    result = InvalidCheckoutError(customer_ID)
+                else:
+                    result = None
+            except Exception as error:
+                result = error
+            if result is None:
+                await self._validated.put(request)
+            else:
+                await self._completed.put((request, result))
+            self._incoming.task_done()
+
+    async def _apply(self):
+        """Applies validated requests to the store, checking out consecutive checkouts in batches.
+        Pending checkouts are applied before any cart add for one of their members or for a product in one of
+        their carts, so every request sees the same store as it would in strict arrival order."""
+        while True:
+            batch = [await self._validated.get()]
+            while len(batch) < self._batch_size and not self._validated.empty():
+                batch.append(self._validated.get_nowait())
+
+            checkouts = []
+            pending_customers = set()
+            pending_products = set()
+            for request in batch:
+                customer_ID = request.get_customer_id()
+                if isinstance(request, CheckoutRequest):
+                    checkouts.append(request)
+                    pending_customers.add(customer_ID)
+                    customer = self._store.lookup_member_from_id(customer_ID)
+                    if customer is not None:
+                        pending_products.update(customer.get_cart())
+                    continue
+                if customer_ID in pending_customers or request.get_product_id() in pending_products:
+                    await self._check_out(checkouts)
+                    checkouts = []
+                    pending_customers = set()
+                    pending_products = set()
+                try:
+                    result = self._store.add_product_to_member_cart(request.get_product_id(), customer_ID,
+                                                                    request.get_quantity())
+                except Exception as error:
+                    result = error
+                await self._completed.put((request, result))
+            await self._check_out(checkouts)
+
+            for _ in batch:
+                self._validated.task_done()
+
+    async def _check_out(self, checkouts):
+        """Checks out a batch of checkout requests and passes their charges on.
+        If the batch checkout raises, every request in the batch is completed with the exception."""
+        if not checkouts:
+            return
+        try:
+            charges, errors = self._store.check_out_members([request.get_customer_id() for request in checkouts])
+        except Exception as error:
+            for request in checkouts:
+                await self._completed.put((request, error))
+            return
+        seen = set()
+        for request in checkouts:
+            customer_ID = request.get_customer_id()
+            if customer_ID in errors:
+                result = errors[customer_ID]
+            elif customer_ID in seen:
+                # The cart was already emptied by an earlier checkout in the same batch.
+                result = 0
+            else:
+                result = charges[customer_ID]
+            seen.add(customer_ID)
+            await self._completed.put((request, result))
+
+    async def _deliver(self):
+        """Hands results back to the callers waiting on each request."""
+        while True:
+            request, result = await self._completed.get()
+            future = request.get_future()
+            if not future.done():
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self._completed.task_done()
+
+
+async def generate_load(pipeline, product_IDs, customer_IDs, requests, concurrency, seed=0, checkout_ratio=0.2):
+    """Sends a seeded random mix of cart and checkout requests through the pipeline from concurrency clients.
+    Returns a dictionary of request kind to the list of request latencies in seconds."""
+    rng = random.Random(seed)
+    latencies = {"cart": [], "checkout": []}
+    remaining = [requests]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            customer_ID = rng.choice(customer_IDs)
+            started = time.perf_counter()
+            if rng.random() < checkout_ratio:
+                try:
+                    await pipeline.check_out_member(customer_ID)
+                except InvalidCheckoutError:
+                    pass
+                latencies["checkout"].append(time.perf_counter() - started)
+            else:
+                await pipeline.add_product_to_member_cart(rng.choice(product_IDs), customer_ID, rng.randint(1, 5))
+                latencies["cart"].append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+async def run_load_test(products, members, requests, concurrency, queue_size, batch_size, seed):
+    """Builds a synthetic store, drives it through an OrderPipeline and prints throughput and latencies."""
+    rng = random.Random(seed)
+    store = Store()
+    for ID in range(products):
+        store.add_product(Product(ID, "Product %d" % ID, "Description %d" % ID, round(rng.uniform(1, 100), 2),
+                                  rng.randint(0, 1000)))
+    for ID in range(members):
+        store.add_member(Customer("Customer %d" % ID, ID, rng.random() < 0.2))
+
+    pipeline = OrderPipeline(store, queue_size, batch_size)
+    pipeline.start()
+    started = time.perf_counter()
+    latencies = await generate_load(pipeline, list(range(products)), list(range(members)), requests, concurrency, seed)
+    await pipeline.stop()
+    elapsed = time.perf_counter() - started
+
+    print("requests: %d" % requests)
+    print("throughput: %.0f requests/s" % (requests / elapsed))
+    for kind, values in latencies.items():
+        print("%-9s p50 %.1f ms  p99 %.1f ms" % (kind, percentile(values, 50) * 1e3, percentile(values, 99) * 1e3))
+
+
+def main():
+    """Runs the order pipeline load generator from the command line."""
+    parser = argparse.ArgumentParser(description="Load generator for the asyncio Store order pipeline.")
+    parser.add_argument("--products", type=int, default=1000, help="number of products")
+    parser.add_argument("--members", type=int, default=1000, help="number of members")
+    parser.add_argument("--requests", type=int, default=20000, help="number of requests to send")
+    parser.add_argument("--concurrency", type=int, default=200, help="number of concurrent clients")
+    parser.add_argument("--queue-size", type=int, default=1000, help="capacity of each pipeline queue")
+    parser.add_argument("--batch-size", type=int, default=100, help="most requests applied per batch")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args.products, args.members, args.requests, args.concurrency, args.queue_size,
+                              args.batch_size, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,38 @@
 # Author: Kay Patel
 
+import functools
+import threading
+import time
+from collections import OrderedDict
+
 
 class InvalidCheckoutError(Exception):
     """Custom exception used when executing the 'check_out_member' method in the Store class."""
     pass
 
 
+class DuplicateIDError(Exception):
+    """Custom exception used when adding a product or member whose ID is already in the Store."""
+    pass
+
+
+def timed(operation):
+    """Decorator for Store methods that reports how long each call took to the Store's timing hook, if one is set."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            hook = self._timing_hook
+            if hook is None:
+                return method(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                hook(operation, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
 class Product:
     """Common base class for all products."""
 
@@ -16,6 +43,8 @@ class Product:
         self._description = description
         self._price = price
         self._quantity_available = quantity_available
+        self._version = 0
+        self._stock_lock = threading.Lock()
 
     def get_product_id(self):
         """Returns the product ID."""
@@ -29,6 +58,14 @@ class Product:
         """Returns the product description."""
         return self._description
 
+    def set_title(self, title):
+        """Sets the product title. Use Store.update_product_text for a product in a Store so searches stay current."""
+        self._title = title
+
+    def set_description(self, description):
+        """Sets the product description. Use Store.update_product_text for a product in a Store so searches stay current."""
+        self._description = description
+
     def get_price(self):
         """Returns the product price."""
         return self._price
@@ -37,9 +74,40 @@ class Product:
         """Returns quantity available."""
         return self._quantity_available
 
-    def decrease_quantity(self):
-        """Decreases quantity available by one."""
-        self._quantity_available -= 1
+    def get_stock(self):
+        """Returns the quantity available and the stock version it was read at, as a tuple."""
+        # The version is read first; writers update the quantity before the version,
+        # so a stale pair always fails compare_and_set_quantity.
+        version = self._version
+        return self._quantity_available, version
+
+    def compare_and_set_quantity(self, version, quantity):
+        """Sets quantity available to the given quantity if the stock is still at the given version.
+        Returns True if the quantity was set, or False if another update got there first."""
+        with self._stock_lock:
+            if self._version != version:
+                return False
+            self._quantity_available = quantity
+            self._version = version + 1
+            return True
+
+    def reserve(self, amount):
+        """Takes up to the given amount out of the quantity available, retrying on conflicting updates.
+        Returns the number of units reserved, which is less than the amount if stock runs short."""
+        while True:
+            quantity, version = self.get_stock()
+            units = min(amount, quantity)
+            if units <= 0:
+                return 0
+            if self.compare_and_set_quantity(version, quantity - units):
+                return units
+
+    def decrease_quantity(self, amount=1):
+        """Decreases quantity available by the given amount (one by default)."""
+        while True:
+            quantity, version = self.get_stock()
+            if self.compare_and_set_quantity(version, quantity - amount):
+                return
 
 
 class Customer:
@@ -50,7 +118,8 @@ class Customer:
         self._name = name
         self._ID = ID
         self._premium_member = premium_member
-        self._cart = []
+        self._cart = {}
+        self._cart_lock = threading.Lock()
 
     def get_name(self):
         """Returns the customer's name."""
@@ -65,71 +134,363 @@ class Customer:
         return self._premium_member
 
     def get_cart(self):
-        """Returns the customer's cart."""
+        """Returns the customer's cart as a dictionary of product ID codes to quantities."""
         return self._cart
 
-    def add_product_to_cart(self, ID):
-        """Takes a product ID code and adds it to the customer's cart."""
-        self._cart.append(ID)
+    def add_product_to_cart(self, ID, quantity=1):
+        """Takes a product ID code and a quantity (one by default) and adds them to the customer's cart.
+        Raises a ValueError if the quantity is less than one."""
+        if quantity < 1:
+            raise ValueError("quantity must be at least 1, got " + str(quantity))
+        with self._cart_lock:
+            self._cart[ID] = self._cart.get(ID, 0) + quantity
 
     def empty_cart(self):
         """Empties the customer's cart."""
-        self._cart.clear()
+        with self._cart_lock:
+            self._cart.clear()
+
+    def take_cart(self):
+        """Empties the customer's cart and returns what was in it."""
+        with self._cart_lock:
+            cart = self._cart
+            self._cart = {}
+        return cart
+
+
+def search_keys(text):
+    """Takes a lowercase text and returns the set of keys it is indexed under: every three-character substring,
+    or the whole text if it is shorter than three characters. Any non-empty substring of the text is contained
+    in one of its keys."""
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[start:start + 3] for start in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Maps every three-character substring of the indexed text to the IDs of the products that contain it.
+    Used by the Store to narrow the products a search has to check."""
+
+    def __init__(self):
+        """Creates a TrigramIndex object and initializes it's attributes."""
+        self._postings = {}
+
+    def add(self, ID, *texts):
+        """Takes an ID and the texts to index for it. Texts are indexed case-insensitively."""
+        for text in texts:
+            for key in search_keys(text.lower()):
+                self._postings.setdefault(key, set()).add(ID)
+
+    def remove(self, ID, *texts):
+        """Takes an ID and the texts it was indexed with and removes the ID from their keys."""
+        for text in texts:
+            for key in search_keys(text.lower()):
+                posting = self._postings.get(key)
+                if posting is not None:
+                    posting.discard(ID)
+                    if not posting:
+                        del self._postings[key]
+
+    def candidates(self, string):
+        """Takes a non-empty lowercase search string and returns a set of IDs that includes every ID whose indexed
+        text contains the string. Matches of strings longer than three characters must still be verified by the
+        caller; for shorter strings every key containing the string is a substring of the text, so the set is exact.
+        A string of three or more characters intersects the postings of its trigrams; a shorter string
+        unites the postings of every key that contains it."""
+        if len(string) < 3:
+            found = set()
+            for key, posting in list(self._postings.items()):
+                if string in key:
+                    found.update(posting)
+            return found
+        postings = []
+        for trigram in search_keys(string):
+            posting = self._postings.get(trigram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+
+class SearchCache:
+    """Bounded least-recently-used cache of search string to product_search result, with hit, miss and
+    eviction counters. Entries are invalidated by the Store when a product that matches them is added or changed."""
+
+    def __init__(self, capacity=512):
+        """Creates a SearchCache object and initializes it's attributes."""
+        self._capacity = capacity
+        self._results = OrderedDict()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, string):
+        """Takes a lowercase search string and returns its cached result, or None if it isn't cached."""
+        with self._lock:
+            result = self._results.get(string)
+            if result is None:
+                self._misses += 1
+                return None
+            self._results.move_to_end(string)
+            self._hits += 1
+            return result
+
+    def get_generation(self):
+        """Returns a counter that changes every time entries are invalidated."""
+        return self._generation
+
+    def put(self, string, result, generation):
+        """Caches the result for the search string, unless entries were invalidated since the given generation
+        (the result may then be stale). Evicts the least recently used entry when the cache is full."""
+        if self._capacity <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._results[string] = result
+            self._results.move_to_end(string)
+            if len(self._results) > self._capacity:
+                self._results.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate_matching(self, *texts):
+        """Drops every cached search string contained in any of the texts (compared case-insensitively)."""
+        texts = [text.lower() for text in texts]
+        with self._lock:
+            self._generation += 1
+            stale = [string for string in self._results if any(string in text for text in texts)]
+            for string in stale:
+                del self._results[string]
+
+    def get_stats(self):
+        """Returns a dictionary with the cache's size, capacity, hits, misses and evictions."""
+        with self._lock:
+            return {"size": len(self._results), "capacity": self._capacity, "hits": self._hits,
+                    "misses": self._misses, "evictions": self._evictions}
 
 
 class Store:
     """Common base class for all stores."""
 
-    def __init__(self):
-        """Creates a Store object and initializes it's attributes."""
-        self._inventory = []
-        self._member = []
+    def __init__(self, search_cache_size=512, inventory=None, search_index=None):
+        """Creates a Store object and initializes it's attributes.
+        The inventory and membership are dictionaries keyed by ID so that lookups take constant time.
+        Up to search_cache_size product_search results are cached; pass 0 to turn caching off.
+        An existing inventory (such as a LazyInventory loaded from a snapshot) can be passed in, with a search
+        index for it; without one the index is built on the first product_search. If the inventory has a
+        get_search_texts(ID) method, searches read titles and descriptions through it instead of from Products."""
+        if inventory is None:
+            self._inventory = {}
+            self._search_index = TrigramIndex()
+        else:
+            self._inventory = inventory
+            self._search_index = search_index
+        self._read_search_texts = getattr(self._inventory, "get_search_texts", None)
+        self._search_index_lock = threading.Lock()
+        self._member = {}
+        self._search_cache = SearchCache(search_cache_size)
+        self._timing_hook = None
+
+    def set_timing_hook(self, hook):
+        """Takes a function called as hook(operation, seconds) after every product_search,
+        add_product_to_member_cart and check_out_member call, or None to turn timing off."""
+        self._timing_hook = hook
 
     def add_product(self, product):
-        """Takes a Product object and adds it to the inventory."""
-        self._inventory.append(product)
+        """Takes a Product object and adds it to the inventory.
+        Raises a DuplicateIDError if a product with the same ID is already in the inventory."""
+        ID = product.get_product_id()
+        if ID in self._inventory:
+            raise DuplicateIDError("product ID " + str(ID) + " already in inventory")
+        with self._search_index_lock:
+            self._inventory[ID] = product
+            if self._search_index is not None:
+                self._search_index.add(ID, product.get_title(), product.get_description())
+        self._search_cache.invalidate_matching(product.get_title(), product.get_description())
+
+    def update_product_text(self, ID, title=None, description=None):
+        """Takes a Product ID and a new title and/or description and updates the product, its search index
+        entries and any cached searches it matched before or matches now.
+        Returns False if the product isn't found in the inventory, otherwise True."""
+        product = self.lookup_product_from_id(ID)
+        if product is None:
+            return False
+        old_title, old_description = product.get_title(), product.get_description()
+        if title is not None:
+            product.set_title(title)
+        if description is not None:
+            product.set_description(description)
+        with self._search_index_lock:
+            if self._search_index is not None:
+                self._search_index.remove(ID, old_title, old_description)
+                self._search_index.add(ID, product.get_title(), product.get_description())
+        self._search_cache.invalidate_matching(old_title, old_description,
+                                               product.get_title(), product.get_description())
+        return True
+
+    def get_inventory(self):
+        """Returns the inventory as a mapping of product ID to Product."""
+        return self._inventory
+
+    def get_search_index(self):
+        """Returns the trigram index over product titles and descriptions, building it first if needed."""
+        with self._search_index_lock:
+            if self._search_index is None:
+                search_index = TrigramIndex()
+                for ID, product in self._inventory.items():
+                    search_index.add(ID, product.get_title(), product.get_description())
+                self._search_index = search_index
+            return self._search_index
+
+    def get_search_cache_stats(self):
+        """Returns a dictionary with the product_search cache's size, capacity, hits, misses and evictions."""
+        return self._search_cache.get_stats()
 
     def add_member(self, customer):
-        """Takes a Customer object and adds it to the member list."""
-        self._member.append(customer)
+        """Takes a Customer object and adds it to the member list.
+        Raises a DuplicateIDError if a customer with the same ID is already a member."""
+        ID = customer.get_customer_id()
+        if ID in self._member:
+            raise DuplicateIDError("member ID " + str(ID) + " already in membership")
+        self._member[ID] = customer
 
     def lookup_product_from_id(self, ID):
         """Takes a Product ID and returns the Product with the matching ID.
         If no matching ID is found in the inventory, it returns the special value None."""
-        # Available upon request
-        pass
+        return self._inventory.get(ID)
 
     def lookup_member_from_id(self, ID):
         """Takes a Customer ID and returns the Customer with the matching ID.
         If no matching ID is found in the membership, it returns the special value None."""
-        # Available upon request
-        pass
+        return self._member.get(ID)
 
+    @timed("product_search")
     def product_search(self, string):
         """Takes a search string and returns a stored list of ID codes for every product in the inventory
         whose title or description contains the search string."""
-        # Available upon request
-        pass
-
-    def add_product_to_member_cart(self, product_ID, customer_ID):
-        """Takes a Product ID and a Customer ID (in that order).
+        string = string.lower()
+        cached = self._search_cache.get(string)
+        if cached is not None:
+            return list(cached)
+        generation = self._search_cache.get_generation()
+        if not string:
+            # add_product inserts under the same lock, so copying here keeps the scan safe from concurrent adds.
+            with self._search_index_lock:
+                candidates = list(self._inventory.keys())
+        else:
+            candidates = self.get_search_index().candidates(string)
+        if len(string) <= 3:
+            # Candidates from the index are exact for strings of up to three characters.
+            found = list(candidates)
+        else:
+            found = []
+            for ID in candidates:
+                if self._read_search_texts is None:
+                    product = self._inventory[ID]
+                    title, description = product.get_title(), product.get_description()
+                else:
+                    title, description = self._read_search_texts(ID)
+                if string in title.lower() or string in description.lower():
+                    found.append(ID)
+        found.sort()
+        self._search_cache.put(string, tuple(found), generation)
+        return found
+
+    @timed("add_product_to_member_cart")
+    def add_product_to_member_cart(self, product_ID, customer_ID, quantity=1):
+        """Takes a Product ID and a Customer ID (in that order), and optionally the quantity to add.
         If the product isn't found in the inventory, returns "product ID not found".
         If the product was found, but the member isn't found in the membership, returns "member ID not found".
         If both are found and the product is still available, calls the member's add_product_to_cart method to add the product and then returns "product added to cart".
-        If the product was not still available, returns "product out of stock". """
-        # Available upon request
-        pass
-
-
+        If the product was not still available, returns "product out of stock".
+        Raises a ValueError if the quantity is less than one."""
+        if quantity < 1:
+            raise ValueError("quantity must be at least 1, got " + str(quantity))
+        product = self.lookup_product_from_id(product_ID)
+        if product is None:
+            return "product ID not found"
+        customer = self.lookup_member_from_id(customer_ID)
+        if customer is None:
+            return "member ID not found"
+        if product.get_quantity_available() > 0:
+            customer.add_product_to_cart(product_ID, quantity)
+            return "product added to cart"
+        return "product out of stock"
+
+    @timed("check_out_member")
     def check_out_member(self, customer_ID):
         """Takes a Customer ID. If the ID doesn't match a member of the store, raises a custom exception.
         Otherwise returns the charge for the member cart. This is the total cost of all the items in the cart,
         not including any items that are not in the inventory or are out of stock, plus the shipping cost.
         If a product is not out of stock, price is added to the total and available quantity of that product is decreased by 1.
         For premium members, the shipping cost is $0. For normal members, the shipping cost is 7% of the total cost of the items in the cart.
-        When the charge for the member's cart has been tabulated, the member's cart should be emptied, and the charge amount returned."""
-        # Available upon request
-        pass
+        When the charge for the member's cart has been tabulated, the member's cart should be emptied, and the charge amount returned.
+        Each distinct product is looked up once; if fewer units are in stock than were ordered, only the units in stock are bought.
+        Stock is reserved with Product.reserve, so concurrent checkouts never oversell."""
+        customer = self.lookup_member_from_id(customer_ID)
+        if customer is None:
+            raise InvalidCheckoutError
+        total = 0
+        for product_ID, quantity in customer.take_cart().items():
+            product = self.lookup_product_from_id(product_ID)
+            if product is None:
+                continue
+            bought = product.reserve(quantity)
+            if bought > 0:
+                total += product.get_price() * bought
+        if not customer.is_premium_member():
+            total += total * 0.07
+        return total
+
+    def check_out_members(self, customer_IDs):
+        """Takes a list of Customer IDs and checks them all out in one pass.
+        Returns a tuple of two dictionaries: the charge for each member that was checked out, and the
+        InvalidCheckoutError for each ID that doesn't match a member. Demand for each product is totalled
+        across all carts and scarce stock goes to members in the order their IDs were given, so each member
+        buys the same units as if check_out_member were called for each ID in turn. Each product's quantity
+        is reserved once."""
+        charges = {}
+        errors = {}
+        customers = []
+        demand = {}
+        for customer_ID in customer_IDs:
+            if customer_ID in charges or customer_ID in errors:
+                continue
+            customer = self._member.get(customer_ID)
+            if customer is None:
+                errors[customer_ID] = InvalidCheckoutError(customer_ID)
+                continue
+            charges[customer_ID] = 0
+            customers.append(customer)
+            for product_ID, quantity in customer.take_cart().items():
+                if quantity <= 0:
+                    continue
+                orders = demand.get(product_ID)
+                if orders is None:
+                    demand[product_ID] = orders = []
+                orders.append((customer_ID, quantity))
+
+        for product_ID, orders in demand.items():
+            product = self._inventory.get(product_ID)
+            if product is None:
+                continue
+            price = product.get_price()
+            available = product.reserve(sum(quantity for customer_ID, quantity in orders))
+            for customer_ID, quantity in orders:
+                units = min(quantity, available)
+                if units <= 0:
+                    continue
+                charges[customer_ID] += price * units
+                available -= units
+
+        for customer in customers:
+            if not customer.is_premium_member():
+                customer_ID = customer.get_customer_id()
+                charges[customer_ID] += charges[customer_ID] * 0.07
+        return charges, errors
 
 
 def main():
@@ -0,0 +1,239 @@
+# Author: Kay Patel
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from store import InvalidCheckoutError, Product, Customer, Store
+
+
+OPERATIONS = ("product_search", "add_product_to_member_cart", "check_out_member")
+WORDS = ("wood", "steel", "garden", "kitchen", "chair", "table", "lamp", "cable", "phone", "shirt",
+         "boots", "paint", "brush", "glass", "stone", "paper", "tent", "drill", "screw", "bottle")
+
+
+class BenchmarkConfig:
+    """Holds the settings for a store load test run."""
+
+    def __init__(self, products=10000, members=1000, operations=100000, seed=0, weights=(30, 55, 15),
+                 trace_memory=True, distinct_queries=5000, search_cache_size=512):
+        """Creates a BenchmarkConfig object and initializes it's attributes.
+        Weights are the relative frequencies of product_search, add_product_to_member_cart and check_out_member calls.
+        Tracing memory slows every allocation, so turn it off when only latencies matter.
+        Searches are drawn from distinct_queries substrings of product titles and descriptions; set
+        search_cache_size to 0 to time the search index itself rather than the result cache."""
+        self._products = products
+        self._members = members
+        self._operations = operations
+        self._seed = seed
+        self._weights = weights
+        self._trace_memory = trace_memory
+        self._distinct_queries = distinct_queries
+        self._search_cache_size = search_cache_size
+
+    def get_products(self):
+        """Returns the number of products in the synthetic catalog."""
+        return self._products
+
+    def get_members(self):
+        """Returns the number of members in the synthetic membership."""
+        return self._members
+
+    def get_operations(self):
+        """Returns the number of workload operations to run."""
+        return self._operations
+
+    def get_seed(self):
+        """Returns the random seed used for the catalog and workload."""
+        return self._seed
+
+    def get_weights(self):
+        """Returns the relative weights of search, add to cart and checkout calls."""
+        return self._weights
+
+    def get_trace_memory(self):
+        """Returns whether peak memory is traced during the run."""
+        return self._trace_memory
+
+    def get_distinct_queries(self):
+        """Returns the number of distinct search strings in the workload."""
+        return self._distinct_queries
+
+    def get_search_cache_size(self):
+        """Returns the store's product_search cache size, 0 meaning no cache."""
+        return self._search_cache_size
+
+
+class BenchmarkReport:
+    """Collects per-operation latencies from a Store's timing hook and summary figures for a load test run."""
+
+    def __init__(self):
+        """Creates a BenchmarkReport object and initializes it's attributes."""
+        self._latencies = {operation: [] for operation in OPERATIONS}
+        self._elapsed = 0.0
+        self._peak_memory = 0
+        self._cache_stats = None
+
+    def record(self, operation, seconds):
+        """Records the latency of a single operation. Used as the Store's timing hook."""
+        self._latencies[operation].append(seconds)
+
+    def get_latencies(self, operation):
+        """Returns the list of recorded latencies for the operation."""
+        return self._latencies[operation]
+
+    def get_elapsed(self):
+        """Returns the total wall clock time of the workload in seconds."""
+        return self._elapsed
+
+    def set_elapsed(self, seconds):
+        """Sets the total wall clock time of the workload."""
+        self._elapsed = seconds
+
+    def get_peak_memory(self):
+        """Returns the peak traced memory in bytes."""
+        return self._peak_memory
+
+    def set_peak_memory(self, peak):
+        """Sets the peak traced memory."""
+        self._peak_memory = peak
+
+    def get_cache_stats(self):
+        """Returns the store's product_search cache counters at the end of the run."""
+        return self._cache_stats
+
+    def set_cache_stats(self, stats):
+        """Sets the store's product_search cache counters."""
+        self._cache_stats = stats
+
+    def get_total_operations(self):
+        """Returns the number of operations recorded."""
+        return sum(len(latencies) for latencies in self._latencies.values())
+
+    def get_throughput(self):
+        """Returns the number of operations per second."""
+        if self._elapsed == 0:
+            return 0.0
+        return self.get_total_operations() / self._elapsed
+
+    def format(self):
+        """Returns the report as printable text."""
+        lines = ["operations: %d" % self.get_total_operations(),
+                 "elapsed: %.3f s" % self._elapsed,
+                 "throughput: %.0f ops/s" % self.get_throughput(),
+                 "peak memory: %.1f MiB" % (self._peak_memory / (1024 * 1024))]
+        if self._cache_stats is not None:
+            stats = self._cache_stats
+            lookups = stats["hits"] + stats["misses"]
+            hit_rate = stats["hits"] / lookups * 100 if lookups else 0.0
+            lines.append("search cache: capacity %d, hits %d, misses %d, evictions %d (%.1f%% hit rate)"
+                         % (stats["capacity"], stats["hits"], stats["misses"], stats["evictions"], hit_rate))
+        lines += ["%-28s %10s %10s %10s %10s" % ("operation", "count", "p50 (us)", "p95 (us)", "p99 (us)")]
+        for operation in OPERATIONS:
+            latencies = self._latencies[operation]
+            lines.append("%-28s %10d %10.1f %10.1f %10.1f" % (operation, len(latencies),
+                                                              percentile(latencies, 50) * 1e6,
+                                                              percentile(latencies, 95) * 1e6,
+                                                              percentile(latencies, 99) * 1e6))
+        return "\n".join(lines)
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile of the values using the nearest-rank method, or 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def build_store(config, rng):
+    """Returns a store stocked with a synthetic catalog and membership, plus the product and member IDs."""
+    store = Store(config.get_search_cache_size())
+    product_IDs = []
+    for number in range(config.get_products()):
+        ID = "P%d" % number
+        title = " ".join(rng.sample(WORDS, 2)) + " " + str(number)
+        description = " ".join(rng.sample(WORDS, 4))
+        store.add_product(Product(ID, title, description, round(rng.uniform(0.5, 200), 2), rng.randint(0, 500)))
+        product_IDs.append(ID)
+    member_IDs = []
+    for number in range(config.get_members()):
+        ID = "C%d" % number
+        store.add_member(Customer("Customer %d" % number, ID, rng.random() < 0.2))
+        member_IDs.append(ID)
+    return store, product_IDs, member_IDs
+
+
+def build_queries(store, product_IDs, count, rng):
+    """Returns up to count distinct search strings, each a random substring of three to eight characters
+    of a random product's title or description."""
+    queries = set()
+    for _ in range(count * 2):
+        if len(queries) >= count:
+            break
+        product = store.lookup_product_from_id(rng.choice(product_IDs))
+        text = rng.choice((product.get_title(), product.get_description())).lower()
+        length = rng.randint(3, 8)
+        start = rng.randint(0, max(0, len(text) - length))
+        queries.add(text[start:start + length])
+    return sorted(queries)
+
+
+def run_benchmark(config):
+    """Builds a synthetic store, drives a seeded random mix of searches, cart adds and checkouts against it
+    with the Store's timing hook enabled, and returns a BenchmarkReport."""
+    rng = random.Random(config.get_seed())
+    report = BenchmarkReport()
+
+    if config.get_trace_memory():
+        tracemalloc.start()
+    store, product_IDs, member_IDs = build_store(config, rng)
+    queries = build_queries(store, product_IDs, config.get_distinct_queries(), rng)
+    store.set_timing_hook(report.record)
+
+    weights = config.get_weights()
+    started = time.perf_counter()
+    for _ in range(config.get_operations()):
+        operation = rng.choices(OPERATIONS, weights)[0]
+        if operation == "product_search":
+            store.product_search(rng.choice(queries))
+        elif operation == "add_product_to_member_cart":
+            store.add_product_to_member_cart(rng.choice(product_IDs), rng.choice(member_IDs), rng.randint(1, 3))
+        else:
+            try:
+                store.check_out_member(rng.choice(member_IDs))
+            except InvalidCheckoutError:
+                pass
+    report.set_elapsed(time.perf_counter() - started)
+    store.set_timing_hook(None)
+    report.set_cache_stats(store.get_search_cache_stats())
+
+    if config.get_trace_memory():
+        report.set_peak_memory(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return report
+
+
+def main():
+    """Runs the store load test from the command line and prints the report."""
+    parser = argparse.ArgumentParser(description="Store load test and latency benchmark.")
+    parser.add_argument("--products", type=int, default=10000, help="number of products")
+    parser.add_argument("--members", type=int, default=1000, help="number of members")
+    parser.add_argument("--operations", type=int, default=100000, help="number of workload operations")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--no-trace-memory", action="store_true", help="skip peak memory tracing")
+    parser.add_argument("--distinct-queries", type=int, default=5000, help="number of distinct search strings")
+    parser.add_argument("--search-cache-size", type=int, default=512,
+                        help="product_search cache size; 0 times the search index without the cache")
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(args.products, args.members, args.operations, args.seed,
+                             trace_memory=not args.no_trace_memory, distinct_queries=args.distinct_queries,
+                             search_cache_size=args.search_cache_size)
+    print(run_benchmark(config).format())
+
+
+if __name__ == '__main__':
+    main()
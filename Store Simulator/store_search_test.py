@@ -0,0 +1,119 @@
+# Author: Kay Patel
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from store import Product, Store, SearchCache
+
+WORDS = ("wood", "steel", "garden", "kitchen", "chair", "table", "lamp", "cable", "phone", "shirt")
+
+
+class StoreSearchTest(unittest.TestCase):
+    """Checks product_search, its trigram index and its result cache against a brute-force substring scan."""
+
+    def brute_force_search(self, store, string):
+        """Returns the sorted IDs of every product whose title or description contains the string."""
+        string = string.lower()
+        return sorted(ID for ID, product in store.get_inventory().items()
+                      if string in product.get_title().lower() or string in product.get_description().lower())
+
+    def random_text(self, rng):
+        """Returns a few random words, sometimes capitalized."""
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        return " ".join(word.upper() if rng.random() < 0.1 else word for word in words)
+
+    def random_query(self, rng):
+        """Returns a random substring of one to six characters of a word or number, or a string matching nothing."""
+        if rng.random() < 0.05:
+            return rng.choice(("", "zz", "qqqq"))
+        word = rng.choice(WORDS + tuple(str(number) for number in range(10)))
+        length = rng.randint(1, min(6, len(word)))
+        start = rng.randint(0, len(word) - length)
+        return word[start:start + length]
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(0)
+        store = Store(search_cache_size=8)
+        next_ID = 0
+        searches = 0
+        for _ in range(3000):
+            roll = rng.random()
+            if roll < 0.15 or next_ID == 0:
+                store.add_product(Product(next_ID, self.random_text(rng) + " " + str(next_ID), self.random_text(rng),
+                                          1, 1))
+                next_ID += 1
+            elif roll < 0.3:
+                ID = rng.randrange(next_ID)
+                title = rng.choice((None, self.random_text(rng)))
+                description = rng.choice((None, self.random_text(rng)))
+                self.assertTrue(store.update_product_text(ID, title, description))
+            else:
+                query = self.random_query(rng)
+                self.assertEqual(store.product_search(query), self.brute_force_search(store, query), query)
+                searches += 1
+
+        stats = store.get_search_cache_stats()
+        self.assertEqual(stats["hits"] + stats["misses"], searches)
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertLessEqual(stats["size"], 8)
+        # Every miss caches its result, which later leaves the cache by eviction, by invalidation or not at all.
+        self.assertLessEqual(stats["size"] + stats["evictions"], stats["misses"])
+
+    def test_cache_counts(self):
+        store = Store(search_cache_size=2)
+        store.add_product(Product(1, "Desk lamp", "Brass", 1, 1))
+        store.add_product(Product(2, "Armchair", "Oak", 1, 1))
+        store.add_product(Product(3, "Side table", "Oak", 1, 1))
+
+        self.assertEqual(store.product_search("lamp"), [1])
+        self.assertEqual(store.product_search("LAMP"), [1])
+        self.assertEqual(store.product_search("cha"), [2])
+        self.assertEqual(store.product_search("tab"), [3])
+        self.assertEqual(store.get_search_cache_stats(),
+                         {"size": 2, "capacity": 2, "hits": 1, "misses": 3, "evictions": 1})
+
+        # "lamp" was the least recently used entry, so it was evicted and has to be searched again.
+        self.assertEqual(store.product_search("lamp"), [1])
+        self.assertEqual(store.get_search_cache_stats(),
+                         {"size": 2, "capacity": 2, "hits": 1, "misses": 4, "evictions": 2})
+
+        # Adding a matching product invalidates the cached "lamp" result but keeps "tab".
+        store.add_product(Product(4, "Floor lamp", "Steel", 1, 1))
+        self.assertEqual(store.get_search_cache_stats()["size"], 1)
+        self.assertEqual(store.product_search("lamp"), [1, 4])
+        self.assertEqual(store.product_search("tab"), [3])
+        self.assertEqual(store.get_search_cache_stats(),
+                         {"size": 2, "capacity": 2, "hits": 2, "misses": 5, "evictions": 2})
+
+        # Retitling invalidates searches the product matched before and matches now.
+        store.update_product_text(3, "Desk lamp")
+        self.assertEqual(store.get_search_cache_stats()["size"], 0)
+        self.assertEqual(store.product_search("tab"), [])
+        self.assertEqual(store.product_search("lamp"), [1, 3, 4])
+
+    def test_stale_result_is_not_cached(self):
+        cache = SearchCache(4)
+        generation = cache.get_generation()
+        # A product was added between the search reading the index and caching its result.
+        cache.invalidate_matching("Desk lamp")
+        cache.put("lamp", (1,), generation)
+        self.assertIsNone(cache.get("lamp"))
+        cache.put("lamp", (1, 2), cache.get_generation())
+        self.assertEqual(cache.get("lamp"), (1, 2))
+
+    def test_uncached_store(self):
+        store = Store(search_cache_size=0)
+        store.add_product(Product(1, "Desk lamp", "Brass", 1, 1))
+        self.assertEqual(store.product_search("lamp"), [1])
+        self.assertEqual(store.product_search("lamp"), [1])
+        stats = store.get_search_cache_stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (0, 0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
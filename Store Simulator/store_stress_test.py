@@ -0,0 +1,159 @@
+# Author: Kay Patel
+
+import os
+import random
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from store import InvalidCheckoutError, Product, Customer, Store
+
+
+class StoreStressTest(unittest.TestCase):
+    """Hammers a shared Store from many threads and checks that stock is never oversold, and checks that
+    check_out_members charges the same as check_out_member called for each ID in turn."""
+
+    THREADS = 16
+    PRODUCTS = 10
+    STOCK = 300
+
+    def setUp(self):
+        """Makes thread switches frequent so operations interleave as much as possible."""
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        """Restores the thread switch interval."""
+        sys.setswitchinterval(self._switch_interval)
+
+    def build_store(self):
+        """Returns a store with a few scarce products, each priced at $1, and one premium member per thread."""
+        store = Store()
+        for ID in range(self.PRODUCTS):
+            store.add_product(Product(ID, "Product", "Description", 1, self.STOCK))
+        for ID in range(self.THREADS):
+            store.add_member(Customer("Customer", ID, True))
+        return store
+
+    def run_workload(self, store, check_out):
+        """Runs one thread per member adding to its cart and checking out with check_out(store, member ID),
+        while another thread watches that no product's stock goes negative. Returns the total charged and
+        the lowest stock seen."""
+        charged = [0] * self.THREADS
+        lowest = [self.STOCK]
+        running = threading.Event()
+        running.set()
+
+        def shopper(customer_ID):
+            rng = random.Random(customer_ID)
+            for _ in range(2000):
+                if rng.random() < 0.7:
+                    store.add_product_to_member_cart(rng.randrange(self.PRODUCTS), customer_ID, rng.randint(1, 4))
+                else:
+                    charged[customer_ID] += check_out(store, customer_ID)
+            charged[customer_ID] += check_out(store, customer_ID)
+
+        def watcher():
+            while running.is_set():
+                for ID in range(self.PRODUCTS):
+                    lowest[0] = min(lowest[0], store.lookup_product_from_id(ID).get_quantity_available())
+
+        watch_thread = threading.Thread(target=watcher)
+        watch_thread.start()
+        threads = [threading.Thread(target=shopper, args=(ID,)) for ID in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        running.clear()
+        watch_thread.join()
+        return sum(charged), lowest[0]
+
+    def check_stock(self, check_out):
+        """Checks that stock never went negative and that every unit that left stock was charged for once."""
+        store = self.build_store()
+        total_charged, lowest = self.run_workload(store, check_out)
+        remaining = [store.lookup_product_from_id(ID).get_quantity_available() for ID in range(self.PRODUCTS)]
+        self.assertGreaterEqual(lowest, 0)
+        self.assertGreaterEqual(min(remaining), 0)
+        self.assertEqual(total_charged, self.PRODUCTS * self.STOCK - sum(remaining))
+        for ID in range(self.THREADS):
+            self.assertEqual(store.lookup_member_from_id(ID).get_cart(), {})
+
+    def test_concurrent_check_out_member(self):
+        self.check_stock(lambda store, customer_ID: store.check_out_member(customer_ID))
+
+    def test_concurrent_check_out_members(self):
+        self.check_stock(lambda store, customer_ID: store.check_out_members([customer_ID])[0][customer_ID])
+
+    def test_check_out_members_matches_check_out_member(self):
+        stores = []
+        for _ in range(2):
+            store = Store()
+            # Product 0 runs out part way through the batch, product 1 is plentiful and product 2 is sold out.
+            store.add_product(Product(0, "Scarce", "Description", 2.5, 5))
+            store.add_product(Product(1, "Plentiful", "Description", 1.25, 100))
+            store.add_product(Product(2, "Sold out", "Description", 4, 0))
+            for ID in range(6):
+                store.add_member(Customer("Customer", ID, ID % 2 == 0))
+            for customer_ID, product_ID, quantity in ((3, 0, 2), (1, 0, 2), (1, 1, 3), (4, 0, 3), (4, 1, 1),
+                                                      (0, 0, 1), (0, 1, 4), (2, 1, 2), (3, 1, 1), (5, 0, 1)):
+                store.add_product_to_member_cart(product_ID, customer_ID, quantity)
+            # A product that was in a cart when it left the inventory is skipped.
+            store.lookup_member_from_id(2).add_product_to_cart("gone", 2)
+            stores.append(store)
+        batch_store, loop_store = stores
+        customer_IDs = [3, 1, 99, 4, 3, 0, 2, 99, 1]
+
+        charges, errors = batch_store.check_out_members(customer_IDs)
+        loop_charges = {}
+        loop_errors = set()
+        for customer_ID in customer_IDs:
+            try:
+                charge = loop_store.check_out_member(customer_ID)
+            except InvalidCheckoutError:
+                loop_errors.add(customer_ID)
+                continue
+            loop_charges[customer_ID] = loop_charges.get(customer_ID, 0) + charge
+
+        self.assertEqual(set(errors), loop_errors)
+        self.assertEqual(set(charges), set(loop_charges))
+        for customer_ID, charge in loop_charges.items():
+            self.assertAlmostEqual(charges[customer_ID], charge)
+        # Members 3 and 1 get the first four units of product 0, member 4 gets the last one and member 0 none.
+        self.assertAlmostEqual(charges[4], 2.5 + 1.25)
+        self.assertAlmostEqual(charges[0], 4 * 1.25)
+        for ID in range(3):
+            self.assertEqual(batch_store.lookup_product_from_id(ID).get_quantity_available(),
+                             loop_store.lookup_product_from_id(ID).get_quantity_available())
+        self.assertEqual(batch_store.lookup_product_from_id(0).get_quantity_available(), 0)
+        for ID in range(6):
+            self.assertEqual(batch_store.lookup_member_from_id(ID).get_cart(),
+                             loop_store.lookup_member_from_id(ID).get_cart())
+        self.assertEqual(batch_store.lookup_member_from_id(5).get_cart(), {0: 1})
+
+    def test_concurrent_reserve(self):
+        product = Product("1", "Product", "Description", 1, 5000)
+        reserved = [0] * self.THREADS
+
+        def reserver(index):
+            rng = random.Random(index)
+            while True:
+                units = product.reserve(rng.randint(1, 7))
+                if units == 0:
+                    return
+                reserved[index] += units
+
+        threads = [threading.Thread(target=reserver, args=(index,)) for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(product.get_quantity_available(), 0)
+        self.assertEqual(sum(reserved), 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()